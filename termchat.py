@@ -3,22 +3,64 @@
 TermChat - A simple terminal AI chat application using OpenRouter
 """
 
+import asyncio
+import hashlib
+import importlib.util
 import os
+import re
 import sys
-from typing import List, Dict, Any
+import time
+from collections import deque
+from typing import List, Dict, Any, Deque, Optional, Tuple
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
 from rich.console import Console
 from rich.panel import Panel
 from rich.text import Text
 from rich.prompt import Prompt, Confirm
-from rich.markdown import Markdown
-from rich.live import Live
-from rich.spinner import Spinner
 
 # Load environment variables
 load_dotenv()
 
+# Popular models available on OpenRouter
+AVAILABLE_MODELS: Tuple[str, ...] = (
+    "anthropic/claude-3.5-sonnet",
+    "anthropic/claude-3-haiku",
+    "openai/gpt-4o",
+    "openai/gpt-4o-mini",
+    "openai/o1-preview",
+    "openai/o1-mini",
+    "openai/gpt-3.5-turbo",
+    "meta-llama/llama-3.1-8b-instruct:free",
+    "microsoft/wizardlm-2-8x22b",
+    "google/gemini-pro-1.5",
+    "mistralai/mistral-7b-instruct:free",
+    "deepseek/deepseek-r1:free",
+    "google/gemma-3n-e4b-it:free",
+)
+
+# Location of the persisted response cache
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".termchat", "cache.json")
+
+# Maximum number of cached responses; the least recently used are dropped
+MAX_CACHE_ENTRIES = 200
+
+# Maximum time (seconds) streamed text is held before being written
+STREAM_FLUSH_INTERVAL = 0.1
+
+# Maximum number of queued chunks handled per display update
+MAX_CHUNKS_PER_UPDATE = 64
+
+def looks_like_markdown(text: str) -> bool:
+    """Cheap check for markdown syntax (code, emphasis, headings, quotes, tables, lists, links)"""
+    return (
+        any(c in text for c in "`*_#>|")
+        or "](" in text
+        or text.startswith(("- ", "1."))
+        or "\n- " in text
+        or "\n1." in text
+    )
+
 class TermChat:
     def __init__(self):
         self.console = Console()
@@ -30,52 +72,75 @@ class TermChat:
             self.console.print("Please copy env.example to .env and add your OpenRouter API key.")
             sys.exit(1)
         
-        # Initialize OpenAI client with OpenRouter
-        self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=self.api_key,
-        )
+        # OpenAI client, created on the first message (see get_client)
+        self.client = None
+        
+        # Event loop used to stream responses; kept for the whole session
+        # so the client's connections can be reused between requests
+        self.loop = asyncio.new_event_loop()
         
-        self.conversation: List[Dict[str, str]] = []
         self.current_model = self.default_model
+        # Number of previous exchanges kept and sent with each request (0 = unlimited)
+        self.max_history_turns = int(os.getenv("MAX_HISTORY_TURNS", "12"))
+        
+        # Bounded history: the oldest messages are dropped automatically so
+        # each request holds the last max_history_turns exchanges plus the
+        # new message
+        max_messages = 2 * self.max_history_turns + 1 if self.max_history_turns > 0 else None
+        self.conversation: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+        
+        # Cache of previous responses, keyed on model + normalized messages
+        self.cache_enabled = os.getenv("RESPONSE_CACHE", "false").lower() in ("1", "true", "yes", "on")
+        self.cache: Dict[str, str] = self.load_cache() if self.cache_enabled else {}
+        
+        # Slash command handlers (/quit and /exit are handled in run)
+        self._commands = {
+            "/help": self.display_help,
+            "/model": self.change_model,
+            "/clear": self.clear_conversation,
+        }
+        
+        # Static parts of the welcome and help screens, built once
+        self._welcome_header = Text("🤖 TermChat - Terminal AI Assistant\n\n", style="bold cyan")
+        self._welcome_commands = Text.assemble(
+            ("Commands:\n", "bold"),
+            ("  /help    - Show this help\n", "dim"),
+            ("  /model   - Change AI model\n", "dim"),
+            ("  /clear   - Clear conversation\n", "dim"),
+            ("  /quit    - Exit the application\n", "dim"),
+            ("\nType your message and press Enter to chat!", "green"),
+        )
+        self._help_panel = Panel(
+            Text.assemble(
+                ("TermChat Commands:\n\n", "bold cyan"),
+                ("/help    - Show this help message\n", "dim"),
+                ("/model   - Change the AI model\n", "dim"),
+                ("/clear   - Clear conversation history\n", "dim"),
+                ("/quit    - Exit the application\n", "dim"),
+                ("\nTips:\n", "bold"),
+                ("• Press Ctrl+C to interrupt AI response\n", "dim"),
+                ("• Recent conversation history is kept until cleared\n", "dim"),
+                ("• Use /model to switch between different AI models\n", "dim"),
+            ),
+            title="Help",
+            border_style="blue",
+        )
         
     def display_welcome(self):
         """Display welcome message and instructions"""
-        welcome_text = Text()
-        welcome_text.append("🤖 TermChat - Terminal AI Assistant\n\n", style="bold cyan")
-        welcome_text.append(f"Current model: {self.current_model}\n", style="dim")
-        welcome_text.append("Commands:\n", style="bold")
-        welcome_text.append("  /help    - Show this help\n", style="dim")
-        welcome_text.append("  /model   - Change AI model\n", style="dim")
-        welcome_text.append("  /clear   - Clear conversation\n", style="dim")
-        welcome_text.append("  /quit    - Exit the application\n", style="dim")
-        welcome_text.append("\nType your message and press Enter to chat!", style="green")
+        welcome_text = Text.assemble(
+            self._welcome_header,
+            (f"Current model: {self.current_model}\n", "dim"),
+            self._welcome_commands,
+        )
         
         panel = Panel(welcome_text, title="Welcome", border_style="cyan")
         self.console.print(panel)
         self.console.print()
 
-    def get_available_models(self) -> List[str]:
-        """Get list of popular models available on OpenRouter"""
-        return [
-            "anthropic/claude-3.5-sonnet",
-            "anthropic/claude-3-haiku",
-            "openai/gpt-4o",
-            "openai/gpt-4o-mini",
-            "openai/o1-preview",
-            "openai/o1-mini",
-            "openai/gpt-3.5-turbo",
-            "meta-llama/llama-3.1-8b-instruct:free",
-            "microsoft/wizardlm-2-8x22b",
-            "google/gemini-pro-1.5",
-            "mistralai/mistral-7b-instruct:free",
-            "deepseek/deepseek-r1:free",
-            "google/gemma-3n-e4b-it:free",
-        ]
-
     def change_model(self):
         """Allow user to change the AI model"""
-        models = self.get_available_models()
+        models = AVAILABLE_MODELS
         
         # Create the model selection display
         menu_text = Text()
@@ -96,8 +161,8 @@ class TermChat:
         
         # Move cursor up to overwrite the menu and input
         lines_to_clear = len(models) + 5  # models + headers + current + prompt + input
-        for _ in range(lines_to_clear):
-            self.console.file.write("\033[1A\033[2K")  # Move up and clear entire line
+        # Move up to the first line and clear everything below it in one write
+        self.console.file.write(f"\033[{lines_to_clear}F\033[J")
         self.console.file.flush()
         
         if choice.isdigit():
@@ -121,105 +186,347 @@ class TermChat:
 
     def display_help(self):
         """Display help information"""
-        help_text = Text()
-        help_text.append("TermChat Commands:\n\n", style="bold cyan")
-        help_text.append("/help    - Show this help message\n", style="dim")
-        help_text.append("/model   - Change the AI model\n", style="dim")
-        help_text.append("/clear   - Clear conversation history\n", style="dim")
-        help_text.append("/quit    - Exit the application\n", style="dim")
-        help_text.append("\nTips:\n", style="bold")
-        help_text.append("• Press Ctrl+C to interrupt AI response\n", style="dim")
-        help_text.append("• Conversation history is maintained until cleared\n", style="dim")
-        help_text.append("• Use /model to switch between different AI models\n", style="dim")
-        
-        panel = Panel(help_text, title="Help", border_style="blue")
-        self.console.print(panel)
+        self.console.print(self._help_panel)
 
-    def get_ai_response(self, message: str) -> tuple[str, bool]:
-        """Get response from OpenRouter AI"""
+    def load_cache(self) -> Dict[str, str]:
+        """Load the response cache from disk"""
         try:
-            # Add user message to conversation
-            self.conversation.append({"role": "user", "content": message})
+            with open(CACHE_PATH, "rb") as f:
+                cache = orjson.loads(f.read())
+            return cache if isinstance(cache, dict) else {}
+        except Exception:
+            return {}
+
+    def save_cache(self):
+        """Write the response cache to disk"""
+        try:
+            os.makedirs(os.path.dirname(CACHE_PATH), mode=0o700, exist_ok=True)
+            # Responses may be private, so the file is only readable by the user
+            fd = os.open(CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps(self.cache))
+            os.chmod(CACHE_PATH, 0o600)
+        except OSError as e:
+            self.console.print(f"[dim]Could not save response cache: {str(e)}[/dim]")
+
+    def get_cache_key(self, messages: List[Dict[str, str]]) -> str:
+        """Build a cache key from the current model and normalized messages"""
+        parts = [self.current_model]
+        for msg in messages:
+            # Ignore surrounding whitespace and trailing punctuation
+            content = msg["content"].strip().rstrip("?!.").rstrip()
             
-            # Create the API request
-            response = self.client.chat.completions.create(
-                model=self.current_model,
-                messages=self.conversation,
-                stream=True,
-                temperature=0.7,
-            )
+            # Single-line prose also ignores case and repeated spaces; anything
+            # multi-line or containing code stays exact so snippets don't collide
+            if "\n" not in content and "`" not in content:
+                content = re.sub(r"\s+", " ", content).lower()
+            parts.append(f"{msg['role']}:{content}")
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+    def display_formatted_response(self, full_response: str):
+        """Display a complete response, formatted as markdown if it uses any"""
+        if looks_like_markdown(full_response):
+            from rich.markdown import Markdown
             
-            # Stream the response with direct printing
-            full_response = ""
-            reasoning_content = ""
-            reasoning_started = False
-            response_started = False
+            body = Markdown(full_response)
+        else:
+            # Plain prose - skip the markdown parser
+            body = Text(full_response.strip())
+        
+        response_panel = Panel(
+            body,
+            title="💬 Formatted Response",
+            border_style="blue",
+            padding=(1, 2)
+        )
+        self.console.print(response_panel)
+
+    def write_stream(self, text: str, style: Optional[str] = None):
+        """Write streamed text to the terminal immediately"""
+        if text:
+            self.console.print(text, end="", style=style, markup=False)
+            self.console.file.flush()
+
+    def show_thinking_indicator(self) -> bool:
+        """Write a placeholder line until the first chunk arrives"""
+        if not self.console.is_terminal:
+            return False
+        # A single dim line with the cursor left at its start, so it can be
+        # cleared without running a Live display
+        self.console.file.write("\033[2mAI is thinking...\033[0m\r")
+        self.console.file.flush()
+        return True
+
+    def clear_thinking_indicator(self):
+        """Remove the placeholder line written by show_thinking_indicator"""
+        self.console.file.write("\r\033[2K")
+        self.console.file.flush()
+
+    def get_client(self):
+        """Get the API client, creating it on first use"""
+        if self.client is None:
+            # Imported here so startup does not pay for loading openai/httpx
+            import httpx
+            from openai import AsyncOpenAI
             
-            # Show initial thinking indicator
-            thinking_spinner = Live(Spinner("dots", text="AI is thinking..."), refresh_per_second=10)
-            thinking_spinner.start()
+            # HTTP/2 needs the optional h2 package; fall back to HTTP/1.1
+            http2 = importlib.util.find_spec("h2") is not None
             
-            try:
-                for chunk in response:
+            # Initialize OpenAI client with OpenRouter, using a pooled
+            # connection that is kept alive between messages
+            self.client = AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=self.api_key,
+                # Identifies the app to OpenRouter
+                default_headers={
+                    "HTTP-Referer": "https://github.com/roshan-c/termchat",
+                    "X-Title": "TermChat",
+                },
+                http_client=httpx.AsyncClient(
+                    http2=http2,
+                    limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
+                    timeout=httpx.Timeout(60.0, connect=5.0),
+                ),
+            )
+        return self.client
+
+    def build_request_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Add prompt caching hints to the messages sent to the API"""
+        # OpenAI, DeepSeek etc. cache repeated prefixes automatically; Anthropic
+        # models need an explicit breakpoint. Marking the message before the new
+        # user message caches the whole history so the next turn can reuse it.
+        if not self.current_model.startswith("anthropic/") or len(messages) < 2:
+            return messages
+        
+        # Once the history window is full the oldest message is dropped every
+        # turn, so the prefix never repeats and a breakpoint would only add
+        # cache-write cost
+        if self.conversation.maxlen is not None and len(self.conversation) >= self.conversation.maxlen:
+            return messages
+        
+        last_cached = messages[-2]
+        return messages[:-2] + [
+            {
+                "role": last_cached["role"],
+                "content": [
+                    {
+                        "type": "text",
+                        "text": last_cached["content"],
+                        "cache_control": {"type": "ephemeral"},
+                    }
+                ],
+            },
+            messages[-1],
+        ]
+
+    async def receive_chunks(self, messages: List[Dict[str, str]], queue: asyncio.Queue):
+        """Read response chunks from the API into the queue"""
+        response = await self.get_client().chat.completions.create(
+            model=self.current_model,
+            messages=self.build_request_messages(messages),
+            stream=True,
+            temperature=0.7,
+        )
+        try:
+            async for chunk in response:
+                await queue.put(chunk)
+        finally:
+            await response.close()
+        
+        # Signal the end of the stream
+        await queue.put(None)
+
+    async def render_chunks(self, queue: asyncio.Queue) -> Tuple[str, str]:
+        """Display response chunks from the queue as they arrive"""
+        # Streamed pieces are collected and joined once at the end
+        response_parts: List[str] = []
+        reasoning_parts: List[str] = []
+        reasoning_started = False
+        response_started = False
+        
+        # Streamed text is written in batches (on newlines or every
+        # STREAM_FLUSH_INTERVAL seconds) rather than once per token
+        pending = ""
+        pending_style = None
+        last_flush = 0.0
+        
+        # Show initial thinking indicator
+        thinking_shown = self.show_thinking_indicator()
+        
+        try:
+            finished = False
+            while not finished:
+                # Wait for the next chunk, but don't hold queued text back for
+                # longer than the flush interval if the stream pauses
+                try:
+                    if pending:
+                        chunk = await asyncio.wait_for(queue.get(), STREAM_FLUSH_INTERVAL)
+                    else:
+                        chunk = await queue.get()
+                except asyncio.TimeoutError:
+                    self.write_stream(pending, pending_style)
+                    pending = ""
+                    last_flush = time.monotonic()
+                    continue
+                
+                # Take everything that has arrived since the last update
+                chunks = [chunk]
+                while not queue.empty() and len(chunks) < MAX_CHUNKS_PER_UPDATE:
+                    chunks.append(queue.get_nowait())
+                
+                new_line = False
+                for chunk in chunks:
+                    if chunk is None:
+                        finished = True
+                        break
+                    
+                    # Some chunks (e.g. usage updates) carry no choices
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    reasoning = getattr(delta, "reasoning", None)
+                    
                     # Check for reasoning content (o1 models)
-                    if hasattr(chunk.choices[0].delta, 'reasoning') and chunk.choices[0].delta.reasoning:
-                        reasoning_content += chunk.choices[0].delta.reasoning
+                    if reasoning:
+                        text = reasoning
+                        reasoning_parts.append(text)
+                        
+                        # Write out any queued response text before switching style
+                        if pending and pending_style != "dim italic":
+                            self.write_stream(pending, pending_style)
+                            pending = ""
                         
                         # Start showing reasoning if we haven't already
                         if not reasoning_started:
-                            thinking_spinner.stop()
+                            if thinking_shown:
+                                self.clear_thinking_indicator()
+                                thinking_shown = False
                             reasoning_started = True
                             self.console.print(f"[bold yellow]🤔 AI is thinking:[/bold yellow]")
                         
-                        # Print reasoning content as it streams
-                        self.console.print(chunk.choices[0].delta.reasoning, end="", style="dim italic", markup=False)
-                        self.console.file.flush()
+                        # Queue reasoning content as it streams
+                        pending += text
+                        pending_style = "dim italic"
                     
                     # Regular response content
-                    elif chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        full_response += content
+                    elif delta.content:
+                        text = delta.content
+                        response_parts.append(text)
                         
-                        # Stop spinner/reasoning and start response preview
+                        # Clear thinking indicator and start response preview
                         if not response_started:
-                            if not reasoning_started:
-                                thinking_spinner.stop()
+                            if thinking_shown:
+                                self.clear_thinking_indicator()
+                                thinking_shown = False
                             
                             response_started = True
                             
                             # Add spacing and header for response
-                            if reasoning_content:
+                            if reasoning_started:
+                                self.write_stream(pending, pending_style)
+                                pending = ""
                                 self.console.print(f"\n\n[bold green]💬 Response:[/bold green]")
                         
-                        # Stream the actual response content as it comes in
-                        self.console.print(content, end="", markup=False)
-                        self.console.file.flush()
+                        # Write out any queued reasoning before switching style
+                        if pending and pending_style is not None:
+                            self.write_stream(pending, pending_style)
+                            pending = ""
+                        
+                        # Queue the actual response content as it comes in
+                        pending += text
+                        pending_style = None
+                    
+                    else:
+                        continue
+                    
+                    new_line = new_line or "\n" in text
+                
+                # Write queued text on line breaks or once the interval has passed
+                now = time.monotonic()
+                if new_line or now - last_flush > STREAM_FLUSH_INTERVAL:
+                    self.write_stream(pending, pending_style)
+                    pending = ""
+                    last_flush = now
+            
+            self.write_stream(pending, pending_style)
+        
+        finally:
+            # Make sure the indicator is removed
+            if thinking_shown:
+                self.clear_thinking_indicator()
+        
+        return "".join(response_parts), "".join(reasoning_parts)
+
+    async def stream_response(self, messages: List[Dict[str, str]]) -> Tuple[str, str]:
+        """Stream a response, receiving and displaying chunks in separate tasks"""
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(self.receive_chunks(messages, queue))
+        consumer = asyncio.create_task(self.render_chunks(queue))
+        try:
+            _, result = await asyncio.gather(producer, consumer)
+        finally:
+            # Stop the other task if one of them failed
+            producer.cancel()
+            consumer.cancel()
+        return result
+
+    def run_async(self, coro):
+        """Run a coroutine on the chat's event loop from synchronous code"""
+        try:
+            return self.loop.run_until_complete(coro)
+        except BaseException:
+            # Cancel anything left running (e.g. after Ctrl+C) so the loop
+            # is clean for the next request
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            raise
+
+    def get_ai_response(self, message: str) -> tuple[str, bool]:
+        """Get response from OpenRouter AI"""
+        try:
+            # Add user message to conversation
+            self.conversation.append({"role": "user", "content": message})
             
-            finally:
-                # Make sure spinner is stopped
-                if thinking_spinner.is_started:
-                    thinking_spinner.stop()
+            # The API needs a list; the deque already holds only the recent exchanges
+            messages_to_send = list(self.conversation)
+            
+            # Replay a cached response for a repeated question
+            cache_key = self.get_cache_key(messages_to_send) if self.cache_enabled else None
+            if cache_key in self.cache:
+                # Move the entry to the end so it is dropped last
+                full_response = self.cache.pop(cache_key)
+                self.cache[cache_key] = full_response
+                self.console.print("[dim](cached response)[/dim]")
+                self.display_formatted_response(full_response)
+                self.conversation.append({"role": "assistant", "content": full_response})
+                return full_response, False
+            
+            # Stream the response, keeping the rest of the app synchronous
+            full_response, reasoning_content = self.run_async(self.stream_response(messages_to_send))
             
             # Replace the streamed content with properly formatted markdown
-            if response_started and full_response.strip():
+            if full_response.strip():
                 # Add some newlines to separate from the raw content
                 self.console.print("\n")
                 
                 # Display the final response with proper markdown formatting
-                markdown_response = Markdown(full_response)
-                response_panel = Panel(
-                    markdown_response,
-                    title="💬 Formatted Response",
-                    border_style="blue",
-                    padding=(1, 2)
-                )
-                self.console.print(response_panel)
-            elif reasoning_started:
+                self.display_formatted_response(full_response)
+            elif reasoning_content:
                 self.console.print()  # Just add newline if only reasoning
             
             # Add AI response to conversation (only the actual response, not reasoning)
             self.conversation.append({"role": "assistant", "content": full_response})
             
+            # Remember the response for repeated questions
+            if cache_key and full_response.strip():
+                self.cache[cache_key] = full_response
+                while len(self.cache) > MAX_CACHE_ENTRIES:
+                    del self.cache[next(iter(self.cache))]
+                self.save_cache()
+            
             # Return response and whether reasoning was present
             return full_response, bool(reasoning_content)
             
@@ -236,6 +543,12 @@ class TermChat:
                 self.conversation.pop()
             return "", False
 
+    def close(self):
+        """Close the API client and event loop"""
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.close())
+        self.loop.close()
+
     def run(self):
         """Main chat loop"""
         self.display_welcome()
@@ -252,15 +565,13 @@ class TermChat:
                 if user_input.startswith('/'):
                     command = user_input.lower()
                     
-                    if command == '/quit' or command == '/exit':
+                    handler = self._commands.get(command)
+                    
+                    if handler:
+                        handler()
+                    elif command in ('/quit', '/exit'):
                         if Confirm.ask("Are you sure you want to quit?"):
                             break
-                    elif command == '/help':
-                        self.display_help()
-                    elif command == '/model':
-                        self.change_model()
-                    elif command == '/clear':
-                        self.clear_conversation()
                     else:
                         self.console.print(f"[red]Unknown command: {user_input}[/red]")
                         self.console.print("Type /help for available commands")
@@ -283,7 +594,10 @@ class TermChat:
 def main():
     """Entry point for the application"""
     chat = TermChat()
-    chat.run()
+    try:
+        chat.run()
+    finally:
+        chat.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file